@@ -1,12 +1,18 @@
 import asyncio
-from fastapi import APIRouter
+from fastapi import APIRouter, Depends
 from lnbits.db import Database
 from lnbits.helpers import template_renderer
 from lnbits.tasks import create_permanent_unique_task
 
 db = Database("ext_tnaflasher")
 
-tnaflasher_ext: APIRouter = APIRouter(prefix="/tnaflasher", tags=["TNA Flasher"])
+from .helpers import request_scope
+
+tnaflasher_ext: APIRouter = APIRouter(
+    prefix="/tnaflasher",
+    tags=["TNA Flasher"],
+    dependencies=[Depends(request_scope)],
+)
 
 tnaflasher_static_files = [
     {
@@ -16,8 +22,15 @@ tnaflasher_static_files = [
 ]
 
 
+_renderer = None
+
+
 def tnaflasher_renderer():
-    return template_renderer(["tnaflasher/templates"])
+    # Build the Jinja2 environment once; it caches compiled templates itself
+    global _renderer
+    if _renderer is None:
+        _renderer = template_renderer(["tnaflasher/templates"])
+    return _renderer
 
 
 from .views import tnaflasher_generic_router
@@ -30,7 +43,9 @@ scheduled_tasks: list[asyncio.Task] = []
 
 
 def tnaflasher_start():
+    from .crud import enable_wal_mode
     from .tasks import wait_for_paid_invoices
+    scheduled_tasks.append(asyncio.create_task(enable_wal_mode()))
     task = create_permanent_unique_task("ext_tnaflasher", wait_for_paid_invoices)
     scheduled_tasks.append(task)
 
@@ -1,13 +1,138 @@
+import asyncio
+import sqlite3
 import time
+from itertools import groupby
 from typing import Optional
-from uuid import uuid4
+
+from lnbits.db import SQLITE
+from loguru import logger
 
 from . import db
-from .models import FlashRequest, Bulletin, PromoCode, Miner, Firmware, AuditLog
+from .helpers import (
+    MISSING,
+    cached,
+    current_epoch_seconds,
+    new_uuid,
+    request_cache_clear,
+    request_cache_get,
+    request_cache_set,
+)
+from .models import FlashRequest, FlashRequestSummary, Bulletin, PromoCode, Miner, Firmware, AuditLog
+
+
+# UPDATE ... RETURNING needs SQLite >= 3.35 (always available on Postgres)
+SUPPORTS_RETURNING = db.type != SQLITE or sqlite3.sqlite_version_info >= (3, 35, 0)
+
+# Hot-path lookups, kept as module constants so every call passes the same
+# string object and driver-side statement caches key on a stable query
+_SQL_GET_FLASH_REQUEST = "SELECT * FROM tnaflasher.flash_requests WHERE payment_hash = :payment_hash"
+_SQL_GET_SETTING = "SELECT value FROM tnaflasher.settings WHERE key = :key"
+_SQL_GET_PROMO_CODE = "SELECT * FROM tnaflasher.promo_codes WHERE code = :code"
+_SQL_GET_MINER = "SELECT * FROM tnaflasher.miners WHERE id = :id"
+_SQL_GET_FIRMWARE = "SELECT * FROM tnaflasher.firmware WHERE id = :id"
+
+# Payment/download state transitions, run once per flash
+_SQL_MARK_FLASH_PAID = """
+    UPDATE tnaflasher.flash_requests
+    SET status = 'paid', paid_at = :paid_at
+    WHERE payment_hash = :payment_hash AND status = 'pending'
+    """
+_SQL_MARK_TOKEN_USED = """
+    UPDATE tnaflasher.flash_requests
+    SET token_used = TRUE
+    WHERE payment_hash = :payment_hash AND status = 'paid'
+    """
+_SQL_MARK_FLASH_COMPLETE = """
+    UPDATE tnaflasher.flash_requests
+    SET status = 'flashed', flashed_at = :flashed_at
+    WHERE payment_hash = :payment_hash AND status = 'paid'
+    """
+_SQL_COUNT_COMPLETED_FLASH = """
+    UPDATE tnaflasher.stats
+    SET total_flashes = total_flashes + 1,
+        total_sats = total_sats + (
+            SELECT amount_sats FROM tnaflasher.flash_requests
+            WHERE payment_hash = :payment_hash
+        )
+    WHERE id = 1
+    """
+_SQL_MARK_FLASH_COMPLETE_RETURNING = f"{_SQL_MARK_FLASH_COMPLETE} RETURNING *"
+
+
+def _build_update_queries(table: str, columns: tuple[str, ...]) -> dict[int, str]:
+    """Precompute the UPDATE for every non-empty column subset (bit i selects columns[i])"""
+    queries = {}
+    for mask in range(1, 1 << len(columns)):
+        assignments = ", ".join(
+            f"{column} = :{column}" for i, column in enumerate(columns) if mask & (1 << i)
+        )
+        queries[mask] = f"UPDATE tnaflasher.{table} SET {assignments} WHERE id = :id"
+    return queries
+
+
+# Partial-update statements, dispatched by a bitmask of the fields provided
+_SQL_UPDATE_BULLETIN = _build_update_queries("bulletins", ("message", "active"))
+_SQL_UPDATE_FIRMWARE = _build_update_queries("firmware", ("price_sats", "notes", "discount_enabled"))
+
+
+async def _execute_returning(query: str, params: dict) -> Optional[dict]:
+    """
+    Run a write statement and return the affected row in the same round-trip.
+    Without RETURNING support the statement is executed and None returned,
+    so callers must fall back to a SELECT.
+    """
+    if not SUPPORTS_RETURNING:
+        await db.execute(query, params)
+        return None
+    return await db.fetchone(f"{query} RETURNING *", params)
+
+
+async def _insert_many(table: str, rows: list[dict]) -> None:
+    """Insert several rows (all with the same keys) with one multi-VALUES statement"""
+    columns = list(rows[0])
+    values = []
+    params = {}
+    for i, row in enumerate(rows):
+        values.append("(" + ", ".join(f":{column}_{i}" for column in columns) + ")")
+        params.update({f"{column}_{i}": row[column] for column in columns})
+
+    await db.execute(
+        f"INSERT INTO tnaflasher.{table} ({', '.join(columns)}) VALUES {', '.join(values)}",
+        params
+    )
+
+
+async def enable_wal_mode() -> None:
+    """Switch the extension's SQLite file to write-ahead logging"""
+    if db.type != SQLITE:
+        return
+    # journal_mode=WAL is stored in the database file, so setting it once at
+    # startup sticks for every later connection. Per-connection pragmas
+    # (synchronous, busy_timeout, ...) belong to LNbits' connection setup.
+    try:
+        await db.execute("PRAGMA tnaflasher.journal_mode=WAL")
+    except Exception as exc:
+        logger.warning(f"tnaflasher: could not enable WAL mode: {exc}")
 
 
 # ============== Flash Requests ==============
 
+# Unknown payment hashes are remembered briefly: polling clients and stray
+# callbacks repeat them. Found rows are never cached (their status changes).
+# Inserts invalidate the entry, which also stops a poll that was reading at
+# the same moment from caching its now-stale miss.
+MISSING_FLASH_TTL = 5
+MISSING_FLASH_CACHE_SIZE = 10000
+
+
+def _flash_from_row(row, model=FlashRequest):
+    """Build a flash request model from a trusted DB row without re-validating it"""
+    values = dict(row)
+    # SQLite stores booleans as 0/1
+    values["token_used"] = bool(values["token_used"])
+    return model.construct(**values)
+
+
 async def create_flash_request(
     payment_hash: str,
     bolt11: str,
@@ -16,8 +141,8 @@ async def create_flash_request(
     amount_sats: int
 ) -> FlashRequest:
     """Create a new flash request record"""
-    request_id = str(uuid4())
-    now = int(time.time())
+    request_id = new_uuid()
+    now = current_epoch_seconds()
 
     await db.execute(
         """
@@ -35,6 +160,8 @@ async def create_flash_request(
             "created_at": now
         }
     )
+    get_flash_request.invalidate(payment_hash)
+    _invalidate_recent_requests()
 
     return FlashRequest(
         id=request_id,
@@ -49,158 +176,241 @@ async def create_flash_request(
     )
 
 
-async def get_flash_request(payment_hash: str) -> Optional[FlashRequest]:
-    """Get a flash request by payment hash"""
-    row = await db.fetchone(
+async def create_paid_flash_request(
+    payment_hash: str,
+    bolt11: str,
+    device: str,
+    version: str,
+    amount_sats: int
+) -> FlashRequest:
+    """Create a flash request that is already paid (free flashes)"""
+    request_id = new_uuid()
+    now = current_epoch_seconds()
+
+    await db.execute(
         """
-        SELECT * FROM tnaflasher.flash_requests
-        WHERE payment_hash = :payment_hash
+        INSERT INTO tnaflasher.flash_requests
+        (id, payment_hash, bolt11, device, version, amount_sats, status, created_at, paid_at)
+        VALUES (:id, :payment_hash, :bolt11, :device, :version, :amount_sats, 'paid', :created_at, :paid_at)
         """,
-        {"payment_hash": payment_hash}
+        {
+            "id": request_id,
+            "payment_hash": payment_hash,
+            "bolt11": bolt11,
+            "device": device,
+            "version": version,
+            "amount_sats": amount_sats,
+            "created_at": now,
+            "paid_at": now
+        }
+    )
+    get_flash_request.invalidate(payment_hash)
+    _invalidate_recent_requests()
+
+    return FlashRequest(
+        id=request_id,
+        payment_hash=payment_hash,
+        bolt11=bolt11,
+        device=device,
+        version=version,
+        amount_sats=amount_sats,
+        status="paid",
+        token_used=False,
+        created_at=now,
+        paid_at=now
     )
 
+
+@cached(ttl=0, miss_ttl=MISSING_FLASH_TTL, maxsize=MISSING_FLASH_CACHE_SIZE)
+async def get_flash_request(payment_hash: str) -> Optional[FlashRequest]:
+    """Get a flash request by payment hash"""
+    row = await db.fetchone(_SQL_GET_FLASH_REQUEST, {"payment_hash": payment_hash})
+
     if not row:
         return None
 
-    return FlashRequest(**row)
+    return _flash_from_row(row)
 
 
 async def mark_flash_paid(payment_hash: str) -> Optional[FlashRequest]:
     """Mark a flash request as paid"""
-    now = int(time.time())
+    now = current_epoch_seconds()
 
-    await db.execute(
-        """
-        UPDATE tnaflasher.flash_requests
-        SET status = 'paid', paid_at = :paid_at
-        WHERE payment_hash = :payment_hash AND status = 'pending'
-        """,
-        {"paid_at": now, "payment_hash": payment_hash}
+    row = await _execute_returning(
+        _SQL_MARK_FLASH_PAID, {"paid_at": now, "payment_hash": payment_hash}
     )
+    _invalidate_recent_requests()
+    if row:
+        return _flash_from_row(row)
 
+    # Not pending any more (or no RETURNING support): report the current row
     return await get_flash_request(payment_hash)
 
 
 async def mark_token_used(payment_hash: str) -> bool:
     """Mark the flash token as used (firmware downloaded)"""
-    await db.execute(
-        """
-        UPDATE tnaflasher.flash_requests
-        SET token_used = TRUE
-        WHERE payment_hash = :payment_hash AND status = 'paid'
-        """,
-        {"payment_hash": payment_hash}
-    )
+    await db.execute(_SQL_MARK_TOKEN_USED, {"payment_hash": payment_hash})
+    _invalidate_recent_requests()
     return True
 
 
 async def mark_flash_complete(payment_hash: str) -> Optional[FlashRequest]:
     """Mark a flash request as complete (device flashed)"""
-    now = int(time.time())
+    now = current_epoch_seconds()
+    params = {"flashed_at": now, "payment_hash": payment_hash}
+
+    # Status change and running totals are updated in one transaction
+    async with db.connect() as conn:
+        if SUPPORTS_RETURNING:
+            row = await conn.fetchone(_SQL_MARK_FLASH_COMPLETE_RETURNING, params)
+            completed = row is not None
+        else:
+            result = await conn.execute(_SQL_MARK_FLASH_COMPLETE, params)
+            row = None
+            completed = result.rowcount > 0
+
+        if completed:
+            await conn.execute(_SQL_COUNT_COMPLETED_FLASH, {"payment_hash": payment_hash})
+    _invalidate_recent_requests()
+
+    if row:
+        return _flash_from_row(row)
+
+    # Not paid (or no RETURNING support): report the current row
+    return await get_flash_request(payment_hash)
 
-    await db.execute(
-        """
-        UPDATE tnaflasher.flash_requests
-        SET status = 'flashed', flashed_at = :flashed_at
-        WHERE payment_hash = :payment_hash AND status = 'paid'
-        """,
-        {"flashed_at": now, "payment_hash": payment_hash}
-    )
 
-    return await get_flash_request(payment_hash)
+# Admin listing of recent requests, served stale-while-revalidate: once the
+# copy is older than RECENT_REQUESTS_TTL it is still returned immediately
+# while a background task reloads it. Flash writes in this process drop it.
+RECENT_REQUESTS_TTL = 10
+_recent_requests: dict[int, tuple[float, list[FlashRequestSummary]]] = {}
+_recent_requests_refreshes: dict[int, asyncio.Task] = {}
+_recent_requests_generation = 0
+
 
+def _invalidate_recent_requests() -> None:
+    """Drop the cached admin listing after a flash request changes"""
+    global _recent_requests_generation
+    _recent_requests_generation += 1
+    _recent_requests.clear()
 
-async def get_all_flash_requests(limit: int = 100) -> list[FlashRequest]:
-    """Get all flash requests, most recent first"""
+
+async def _load_recent_requests(limit: int) -> list[FlashRequestSummary]:
+    """Read recent requests and cache them unless a write happened meanwhile"""
+    generation = _recent_requests_generation
     rows = await db.fetchall(
         """
-        SELECT * FROM tnaflasher.flash_requests
+        SELECT id, payment_hash, device, version, amount_sats, status,
+               token_used, created_at, paid_at, flashed_at
+        FROM tnaflasher.flash_requests
         ORDER BY created_at DESC
         LIMIT :limit
         """,
         {"limit": limit}
     )
 
-    return [FlashRequest(**row) for row in rows]
+    requests = [_flash_from_row(row, FlashRequestSummary) for row in rows]
+    if generation == _recent_requests_generation:
+        _recent_requests[limit] = (time.monotonic() + RECENT_REQUESTS_TTL, requests)
+    return requests
+
+
+async def _refresh_recent_requests(limit: int) -> None:
+    """Background reload of a stale admin listing"""
+    try:
+        await _load_recent_requests(limit)
+    except Exception as exc:
+        # Keep serving the stale copy; the next request retries
+        logger.warning(f"tnaflasher: refreshing recent requests failed: {exc}")
+    finally:
+        _recent_requests_refreshes.pop(limit, None)
+
+
+async def get_all_flash_requests_brief(limit: int = 100) -> list[FlashRequestSummary]:
+    """Get recent flash requests for admin listings, skipping the bolt11 column"""
+    entry = _recent_requests.get(limit)
+    if entry is None:
+        return await _load_recent_requests(limit)
+
+    expires_at, requests = entry
+    if expires_at <= time.monotonic() and limit not in _recent_requests_refreshes:
+        _recent_requests_refreshes[limit] = asyncio.create_task(_refresh_recent_requests(limit))
+    return requests
 
 
 async def get_stats() -> dict:
     """Get statistics for admin dashboard"""
-    # Total flashes (status = 'flashed')
-    total_row = await db.fetchone(
-        """
-        SELECT COUNT(*) as count, COALESCE(SUM(amount_sats), 0) as total
-        FROM tnaflasher.flash_requests
-        WHERE status = 'flashed'
-        """
-    )
-    total_flashes = total_row["count"] if total_row else 0
-    total_sats = total_row["total"] if total_row else 0
+    now = current_epoch_seconds()
+    today_start = now - (now % 86400)
 
-    # Today's flashes
-    today_start = int(time.time()) - (int(time.time()) % 86400)
-    today_row = await db.fetchone(
+    # All-time totals are maintained incrementally by mark_flash_complete;
+    # today's and pending counts are index-backed lookups on flash_requests
+    row = await db.fetchone(
         """
-        SELECT COUNT(*) as count
-        FROM tnaflasher.flash_requests
-        WHERE status = 'flashed' AND flashed_at >= :today_start
+        SELECT
+            s.total_flashes,
+            s.total_sats,
+            (
+                SELECT COUNT(*) FROM tnaflasher.flash_requests
+                WHERE status = 'flashed' AND flashed_at >= :today_start
+            ) AS today_flashes,
+            (
+                SELECT COUNT(*) FROM tnaflasher.flash_requests
+                WHERE status = 'pending'
+            ) AS pending_count
+        FROM tnaflasher.stats s
+        WHERE s.id = 1
         """,
         {"today_start": today_start}
     )
-    today_flashes = today_row["count"] if today_row else 0
-
-    # Pending count
-    pending_row = await db.fetchone(
-        """
-        SELECT COUNT(*) as count
-        FROM tnaflasher.flash_requests
-        WHERE status = 'pending'
-        """
-    )
-    pending_count = pending_row["count"] if pending_row else 0
 
     return {
-        "total_flashes": total_flashes,
-        "total_sats": total_sats,
-        "today_flashes": today_flashes,
-        "pending_count": pending_count
+        "total_flashes": row["total_flashes"] if row else 0,
+        "total_sats": row["total_sats"] if row else 0,
+        "today_flashes": row["today_flashes"] if row else 0,
+        "pending_count": row["pending_count"] if row else 0
     }
 
 
 # ============== Settings ==============
 
+# Settings change rarely but are read on nearly every request
+SETTINGS_CACHE_TTL = 30
+
+
+def invalidate_setting(key: Optional[str] = None) -> None:
+    """Drop a cached setting (or all settings if no key is given)"""
+    if key is None:
+        get_setting.clear()
+    else:
+        get_setting.invalidate(key)
+
+
+@cached(ttl=SETTINGS_CACHE_TTL, lock=True)
 async def get_setting(key: str) -> Optional[str]:
     """Get a setting value by key"""
-    row = await db.fetchone(
-        """
-        SELECT value FROM tnaflasher.settings WHERE key = :key
-        """,
-        {"key": key}
-    )
+    row = await db.fetchone(_SQL_GET_SETTING, {"key": key})
     return row["value"] if row else None
 
 
 async def set_setting(key: str, value: str) -> None:
     """Set a setting value (upsert)"""
-    now = int(time.time())
+    now = current_epoch_seconds()
 
-    # Check if exists
-    existing = await get_setting(key)
+    # Single atomic upsert (Postgres and SQLite >= 3.24)
+    await db.execute(
+        """
+        INSERT INTO tnaflasher.settings (key, value, updated_at)
+        VALUES (:key, :value, :updated_at)
+        ON CONFLICT (key) DO UPDATE
+        SET value = excluded.value, updated_at = excluded.updated_at
+        """,
+        {"key": key, "value": value, "updated_at": now}
+    )
 
-    if existing is not None:
-        await db.execute(
-            """
-            UPDATE tnaflasher.settings SET value = :value, updated_at = :updated_at WHERE key = :key
-            """,
-            {"value": value, "updated_at": now, "key": key}
-        )
-    else:
-        await db.execute(
-            """
-            INSERT INTO tnaflasher.settings (key, value, updated_at) VALUES (:key, :value, :updated_at)
-            """,
-            {"key": key, "value": value, "updated_at": now}
-        )
+    # Write through so readers see the new value immediately
+    get_setting.prime(value, key)
 
 
 async def get_price() -> int:
@@ -227,10 +437,14 @@ async def set_wallet_id(wallet_id: str) -> None:
 
 # ============== Bulletins ==============
 
+# Bulletin lists are read on every public page load and change only through
+# the admin endpoints, which clear this cache
+BULLETINS_CACHE_TTL = 30
+
 async def create_bulletin(message: str) -> Bulletin:
     """Create a new bulletin"""
-    bulletin_id = str(uuid4())
-    now = int(time.time())
+    bulletin_id = new_uuid()
+    now = current_epoch_seconds()
 
     await db.execute(
         """
@@ -239,6 +453,7 @@ async def create_bulletin(message: str) -> Bulletin:
         """,
         {"id": bulletin_id, "message": message, "created_at": now}
     )
+    get_bulletins.clear()
 
     return Bulletin(
         id=bulletin_id,
@@ -248,6 +463,7 @@ async def create_bulletin(message: str) -> Bulletin:
     )
 
 
+@cached(ttl=BULLETINS_CACHE_TTL)
 async def get_bulletins(active_only: bool = True) -> list[Bulletin]:
     """Get all bulletins, optionally only active ones"""
     if active_only:
@@ -271,39 +487,52 @@ async def get_bulletins(active_only: bool = True) -> list[Bulletin]:
     return [Bulletin(**row) for row in rows]
 
 
+async def get_bulletin(bulletin_id: str) -> Optional[Bulletin]:
+    """Get a bulletin by ID"""
+    cache_key = ("bulletin", bulletin_id)
+    bulletin = request_cache_get(cache_key)
+    if bulletin is not MISSING:
+        return bulletin
+
+    row = await db.fetchone(
+        """
+        SELECT * FROM tnaflasher.bulletins WHERE id = :id
+        """,
+        {"id": bulletin_id}
+    )
+    bulletin = Bulletin(**row) if row else None
+    request_cache_set(cache_key, bulletin)
+    return bulletin
+
+
 async def update_bulletin(bulletin_id: str, message: str = None, active: bool = None) -> Optional[Bulletin]:
     """Update a bulletin"""
-    updates = []
+    mask = 0
     params = {"id": bulletin_id}
 
     if message is not None:
-        updates.append("message = :message")
+        mask |= 1
         params["message"] = message
 
     if active is not None:
-        updates.append("active = :active")
+        mask |= 2
         params["active"] = active
 
-    if not updates:
+    # Nothing to change: no write needed, just report the current row
+    if not mask:
+        return await get_bulletin(bulletin_id)
+
+    row = await _execute_returning(_SQL_UPDATE_BULLETIN[mask], params)
+    get_bulletins.clear()
+    request_cache_clear()
+    if row:
+        bulletin = Bulletin(**row)
+        request_cache_set(("bulletin", bulletin_id), bulletin)
+        return bulletin
+    if SUPPORTS_RETURNING:
         return None
 
-    await db.execute(
-        f"""
-        UPDATE tnaflasher.bulletins
-        SET {', '.join(updates)}
-        WHERE id = :id
-        """,
-        params
-    )
-
-    row = await db.fetchone(
-        """
-        SELECT * FROM tnaflasher.bulletins WHERE id = :id
-        """,
-        {"id": bulletin_id}
-    )
-
-    return Bulletin(**row) if row else None
+    return await get_bulletin(bulletin_id)
 
 
 async def delete_bulletin(bulletin_id: str) -> bool:
@@ -314,15 +543,42 @@ async def delete_bulletin(bulletin_id: str) -> bool:
         """,
         {"id": bulletin_id}
     )
+    get_bulletins.clear()
+    request_cache_clear()
     return True
 
 
 # ============== Promo Codes ==============
 
+# Recently looked-up promo codes. Unknown codes are cached too (for less
+# time) so invalid-code probing doesn't reach the DB.
+PROMO_CACHE_TTL = 15
+PROMO_CACHE_MISS_TTL = 5
+PROMO_CACHE_SIZE = 256
+
+# The full set of codes, so guessed or mistyped codes are rejected without a
+# query. Cleared when a code is created or deleted; the TTL bounds staleness
+# when another worker makes the change.
+KNOWN_PROMO_CODES_TTL = 60
+
+
+@cached(ttl=KNOWN_PROMO_CODES_TTL, lock=True)
+async def _get_known_promo_codes() -> frozenset[str]:
+    """All promo code strings (upper-cased, as stored)"""
+    rows = await db.fetchall("SELECT code FROM tnaflasher.promo_codes")
+    return frozenset(row["code"] for row in rows)
+
+
+def _invalidate_promo_cache() -> None:
+    """Forget all cached promo codes (the table is tiny, so clear it all)"""
+    get_promo_code_by_code.clear()
+    request_cache_clear()
+
+
 async def create_promo_code(code: str, discount_percent: int, max_uses: int) -> PromoCode:
     """Create a new promo code"""
-    promo_id = str(uuid4())
-    now = int(time.time())
+    promo_id = new_uuid()
+    now = current_epoch_seconds()
 
     await db.execute(
         """
@@ -337,6 +593,8 @@ async def create_promo_code(code: str, discount_percent: int, max_uses: int) ->
             "created_at": now
         }
     )
+    _get_known_promo_codes.clear()
+    _invalidate_promo_cache()
 
     return PromoCode(
         id=promo_id,
@@ -360,15 +618,10 @@ async def get_promo_codes() -> list[PromoCode]:
     return [PromoCode(**row) for row in rows]
 
 
+@cached(ttl=PROMO_CACHE_TTL, maxsize=PROMO_CACHE_SIZE, miss_ttl=PROMO_CACHE_MISS_TTL)
 async def get_promo_code_by_code(code: str) -> Optional[PromoCode]:
     """Get a promo code by its code string"""
-    row = await db.fetchone(
-        """
-        SELECT * FROM tnaflasher.promo_codes
-        WHERE code = :code
-        """,
-        {"code": code.upper()}
-    )
+    row = await db.fetchone(_SQL_GET_PROMO_CODE, {"code": code.upper()})
     return PromoCode(**row) if row else None
 
 
@@ -377,6 +630,9 @@ async def validate_promo_code(code: str) -> tuple[bool, int, str]:
     Validate a promo code.
     Returns: (is_valid, discount_percent, message)
     """
+    if code.upper() not in await _get_known_promo_codes():
+        return (False, 0, "Invalid promo code")
+
     promo = await get_promo_code_by_code(code)
 
     if not promo:
@@ -391,30 +647,60 @@ async def validate_promo_code(code: str) -> tuple[bool, int, str]:
     return (True, promo.discount_percent, f"{promo.discount_percent}% discount applied!")
 
 
-async def increment_promo_usage(code: str) -> bool:
-    """Increment the usage count for a promo code"""
+async def try_consume_promo(code: str) -> Optional[int]:
+    """
+    Atomically claim one use of a promo code.
+    Returns the discount percent, or None if the code is invalid, inactive or used up.
+    """
+    if code.upper() not in await _get_known_promo_codes():
+        return None
+
+    query = """
+        UPDATE tnaflasher.promo_codes
+        SET used_count = used_count + 1
+        WHERE code = :code AND active = TRUE AND used_count < max_uses
+        """
+    params = {"code": code.upper()}
+
+    if SUPPORTS_RETURNING:
+        row = await db.fetchone(f"{query} RETURNING discount_percent", params)
+    else:
+        result = await db.execute(query, params)
+        row = None
+        if result.rowcount:
+            row = await db.fetchone(
+                """
+                SELECT discount_percent FROM tnaflasher.promo_codes WHERE code = :code
+                """,
+                params
+            )
+
+    if not row:
+        return None
+
+    _invalidate_promo_cache()
+    return row["discount_percent"]
+
+
+async def release_promo(code: str) -> None:
+    """Give back a use claimed by try_consume_promo (e.g. invoice creation failed)"""
     await db.execute(
         """
         UPDATE tnaflasher.promo_codes
-        SET used_count = used_count + 1
-        WHERE code = :code
+        SET used_count = used_count - 1
+        WHERE code = :code AND used_count > 0
         """,
         {"code": code.upper()}
     )
-    return True
+    _invalidate_promo_cache()
 
 
-async def update_promo_code(promo_id: str, active: bool = None) -> Optional[PromoCode]:
-    """Update a promo code (toggle active status)"""
-    if active is not None:
-        await db.execute(
-            """
-            UPDATE tnaflasher.promo_codes
-            SET active = :active
-            WHERE id = :id
-            """,
-            {"active": active, "id": promo_id}
-        )
+async def get_promo_code(promo_id: str) -> Optional[PromoCode]:
+    """Get a promo code by ID"""
+    cache_key = ("promo_id", promo_id)
+    promo = request_cache_get(cache_key)
+    if promo is not MISSING:
+        return promo
 
     row = await db.fetchone(
         """
@@ -422,7 +708,34 @@ async def update_promo_code(promo_id: str, active: bool = None) -> Optional[Prom
         """,
         {"id": promo_id}
     )
-    return PromoCode(**row) if row else None
+    promo = PromoCode(**row) if row else None
+    request_cache_set(cache_key, promo)
+    return promo
+
+
+async def update_promo_code(promo_id: str, active: bool = None) -> Optional[PromoCode]:
+    """Update a promo code (toggle active status)"""
+    # Nothing to change: no write needed, just report the current row
+    if active is None:
+        return await get_promo_code(promo_id)
+
+    row = await _execute_returning(
+        """
+        UPDATE tnaflasher.promo_codes
+        SET active = :active
+        WHERE id = :id
+        """,
+        {"active": active, "id": promo_id}
+    )
+    _invalidate_promo_cache()
+    if row:
+        promo = PromoCode(**row)
+        request_cache_set(("promo_id", promo_id), promo)
+        return promo
+    if SUPPORTS_RETURNING:
+        return None
+
+    return await get_promo_code(promo_id)
 
 
 async def delete_promo_code(promo_id: str) -> bool:
@@ -433,15 +746,21 @@ async def delete_promo_code(promo_id: str) -> bool:
         """,
         {"id": promo_id}
     )
+    _get_known_promo_codes.clear()
+    _invalidate_promo_cache()
     return True
 
 
 # ============== Miners ==============
 
+# Miners and firmware only change through the admin endpoints below
+CATALOG_CACHE_TTL = 30
+
+
 async def create_miner(name: str) -> Miner:
     """Create a new miner"""
-    miner_id = str(uuid4())
-    now = int(time.time())
+    miner_id = new_uuid()
+    now = current_epoch_seconds()
 
     await db.execute(
         """
@@ -450,6 +769,7 @@ async def create_miner(name: str) -> Miner:
         """,
         {"id": miner_id, "name": name, "created_at": now}
     )
+    request_cache_clear()
 
     return Miner(
         id=miner_id,
@@ -469,14 +789,10 @@ async def get_miners() -> list[Miner]:
     return [Miner(**row) for row in rows]
 
 
+@cached(ttl=CATALOG_CACHE_TTL)
 async def get_miner(miner_id: str) -> Optional[Miner]:
     """Get a miner by ID"""
-    row = await db.fetchone(
-        """
-        SELECT * FROM tnaflasher.miners WHERE id = :id
-        """,
-        {"id": miner_id}
-    )
+    row = await db.fetchone(_SQL_GET_MINER, {"id": miner_id})
     return Miner(**row) if row else None
 
 
@@ -491,22 +807,57 @@ async def get_miner_by_name(name: str) -> Optional[Miner]:
     return Miner(**row) if row else None
 
 
-async def delete_miner(miner_id: str) -> bool:
-    """Delete a miner and all its firmware (cascade)"""
-    # First delete all firmware for this miner
-    await db.execute(
+async def get_miners_with_firmware() -> list[tuple[Miner, list[Firmware]]]:
+    """Get all miners with their firmware (newest first) in a single query"""
+    rows = await db.fetchall(
         """
-        DELETE FROM tnaflasher.firmware WHERE miner_id = :miner_id
-        """,
-        {"miner_id": miner_id}
-    )
-    # Then delete the miner
-    await db.execute(
+        SELECT
+            m.id AS m_id, m.name AS m_name, m.created_at AS m_created_at,
+            f.id, f.miner_id, f.version, f.price_sats, f.notes,
+            f.discount_enabled, f.file_path, f.created_at
+        FROM tnaflasher.miners m
+        LEFT JOIN tnaflasher.firmware f ON f.miner_id = m.id
+        ORDER BY m.name ASC, m.id, f.created_at DESC
         """
-        DELETE FROM tnaflasher.miners WHERE id = :id
-        """,
-        {"id": miner_id}
     )
+
+    result = []
+    for _, group in groupby(rows, key=lambda row: row["m_id"]):
+        group = list(group)
+        first = group[0]
+        miner = Miner(id=first["m_id"], name=first["m_name"], created_at=first["m_created_at"])
+        # LEFT JOIN yields a single all-NULL firmware row for miners without firmware
+        firmware = [
+            Firmware(**{k: v for k, v in row.items() if not k.startswith("m_")})
+            for row in group
+            if row["id"] is not None
+        ]
+        result.append((miner, firmware))
+
+    return result
+
+
+async def delete_miner(miner_id: str) -> bool:
+    """Delete a miner and all its firmware (cascade)"""
+    # One transaction, so a failure can't leave firmware rows without a miner
+    async with db.connect() as conn:
+        # First delete all firmware for this miner
+        await conn.execute(
+            """
+            DELETE FROM tnaflasher.firmware WHERE miner_id = :miner_id
+            """,
+            {"miner_id": miner_id}
+        )
+        # Then delete the miner
+        await conn.execute(
+            """
+            DELETE FROM tnaflasher.miners WHERE id = :id
+            """,
+            {"id": miner_id}
+        )
+    get_miner.invalidate(miner_id)
+    get_firmware.clear()
+    request_cache_clear()
     return True
 
 
@@ -521,8 +872,8 @@ async def create_firmware(
     discount_enabled: bool = True
 ) -> Firmware:
     """Create a new firmware entry"""
-    firmware_id = str(uuid4())
-    now = int(time.time())
+    firmware_id = new_uuid()
+    now = current_epoch_seconds()
 
     await db.execute(
         """
@@ -540,6 +891,7 @@ async def create_firmware(
             "created_at": now
         }
     )
+    request_cache_clear()
 
     return Firmware(
         id=firmware_id,
@@ -553,6 +905,21 @@ async def create_firmware(
     )
 
 
+async def create_firmware_many(items: list[dict]) -> list[Firmware]:
+    """
+    Create several firmware entries in a single round-trip.
+    Each item takes the same keyword arguments as create_firmware.
+    """
+    if not items:
+        return []
+
+    now = current_epoch_seconds()
+    firmware_list = [Firmware(id=new_uuid(), created_at=now, **item) for item in items]
+    await _insert_many("firmware", [firmware.dict() for firmware in firmware_list])
+    request_cache_clear()
+    return firmware_list
+
+
 async def get_firmware_by_miner(miner_id: str) -> list[Firmware]:
     """Get all firmware for a miner"""
     rows = await db.fetchall(
@@ -566,19 +933,20 @@ async def get_firmware_by_miner(miner_id: str) -> list[Firmware]:
     return [Firmware(**row) for row in rows]
 
 
+@cached(ttl=CATALOG_CACHE_TTL)
 async def get_firmware(firmware_id: str) -> Optional[Firmware]:
     """Get firmware by ID"""
-    row = await db.fetchone(
-        """
-        SELECT * FROM tnaflasher.firmware WHERE id = :id
-        """,
-        {"id": firmware_id}
-    )
+    row = await db.fetchone(_SQL_GET_FIRMWARE, {"id": firmware_id})
     return Firmware(**row) if row else None
 
 
 async def get_firmware_by_miner_and_version(miner_id: str, version: str) -> Optional[Firmware]:
     """Get firmware by miner ID and version"""
+    cache_key = ("firmware_version", miner_id, version)
+    firmware = request_cache_get(cache_key)
+    if firmware is not MISSING:
+        return firmware
+
     row = await db.fetchone(
         """
         SELECT * FROM tnaflasher.firmware
@@ -586,7 +954,9 @@ async def get_firmware_by_miner_and_version(miner_id: str, version: str) -> Opti
         """,
         {"miner_id": miner_id, "version": version}
     )
-    return Firmware(**row) if row else None
+    firmware = Firmware(**row) if row else None
+    request_cache_set(cache_key, firmware)
+    return firmware
 
 
 async def update_firmware(
@@ -596,32 +966,34 @@ async def update_firmware(
     discount_enabled: Optional[bool] = None
 ) -> Optional[Firmware]:
     """Update firmware details"""
-    updates = []
+    mask = 0
     params = {"id": firmware_id}
 
     if price_sats is not None:
-        updates.append("price_sats = :price_sats")
+        mask |= 1
         params["price_sats"] = price_sats
 
     if notes is not None:
-        updates.append("notes = :notes")
+        mask |= 2
         params["notes"] = notes
 
     if discount_enabled is not None:
-        updates.append("discount_enabled = :discount_enabled")
+        mask |= 4
         params["discount_enabled"] = discount_enabled
 
-    if not updates:
+    # Nothing to change: no write needed, just report the current row
+    if not mask:
         return await get_firmware(firmware_id)
 
-    await db.execute(
-        f"""
-        UPDATE tnaflasher.firmware
-        SET {', '.join(updates)}
-        WHERE id = :id
-        """,
-        params
-    )
+    row = await _execute_returning(_SQL_UPDATE_FIRMWARE[mask], params)
+    get_firmware.invalidate(firmware_id)
+    request_cache_clear()
+    if row:
+        firmware = Firmware(**row)
+        get_firmware.prime(firmware, firmware_id)
+        return firmware
+    if SUPPORTS_RETURNING:
+        return None
 
     return await get_firmware(firmware_id)
 
@@ -634,6 +1006,8 @@ async def delete_firmware(firmware_id: str) -> bool:
         """,
         {"id": firmware_id}
     )
+    get_firmware.invalidate(firmware_id)
+    request_cache_clear()
     return True
 
 
@@ -684,8 +1058,8 @@ async def create_audit_log(
     device_mac: Optional[str] = None
 ) -> AuditLog:
     """Create an audit log entry"""
-    log_id = str(uuid4())
-    now = int(time.time())
+    log_id = new_uuid()
+    now = current_epoch_seconds()
 
     await db.execute(
         """
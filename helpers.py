@@ -1,2 +1,176 @@
 # Helper functions for TNA Flasher extension
-# Currently empty - add utility functions as needed
+import asyncio
+import functools
+import re
+import secrets
+import time
+from collections import OrderedDict
+from contextvars import ContextVar
+from typing import Any, Callable, Hashable, Optional
+from uuid import UUID
+
+# Sentinel returned by request_cache_get on a miss (None is a valid cached value)
+MISSING = object()
+
+# Per-request memo for primary-key lookups. Populated by the request_scope
+# dependency; stays None in background tasks, where caching is a no-op.
+_request_cache: ContextVar[Optional[dict]] = ContextVar("tnaflasher_request_cache", default=None)
+
+# Wall-clock time (epoch seconds) captured once at the start of each request
+_request_now: ContextVar[Optional[int]] = ContextVar("tnaflasher_request_now", default=None)
+
+# Random IDs are handed out from a pool filled with one CSPRNG read per batch
+UUID_BATCH_SIZE = 256
+_uuid_pool: list[str] = []
+
+_VERSION_NUMBERS = re.compile(r"\d+")
+
+
+async def request_scope() -> None:
+    """Router dependency that gives each HTTP request its own lookup cache and clock"""
+    _request_cache.set({})
+    _request_now.set(int(time.time()))
+
+
+def current_epoch_seconds() -> int:
+    """Current time in epoch seconds, read once per request where possible"""
+    now = _request_now.get()
+    return now if now is not None else int(time.time())
+
+
+def new_uuid() -> str:
+    """Return a fresh random (version 4) UUID string"""
+    if not _uuid_pool:
+        raw = secrets.token_bytes(16 * UUID_BATCH_SIZE)
+        _uuid_pool.extend(
+            str(UUID(bytes=raw[i:i + 16], version=4)) for i in range(0, len(raw), 16)
+        )
+    return _uuid_pool.pop()
+
+
+def version_sort_key(version: str) -> tuple[int, ...]:
+    """Sort key comparing the numeric parts of a version ("v3.42" > "v3.7")"""
+    return tuple(int(part) for part in _VERSION_NUMBERS.findall(version))
+
+
+def request_cache_get(key: Hashable) -> Any:
+    """Get a value memoized during the current request, or MISSING"""
+    cache = _request_cache.get()
+    if cache is None:
+        return MISSING
+    return cache.get(key, MISSING)
+
+
+def request_cache_set(key: Hashable, value: Any) -> None:
+    """Memoize a value for the rest of the current request"""
+    cache = _request_cache.get()
+    if cache is not None:
+        cache[key] = value
+
+
+def request_cache_clear() -> None:
+    """Forget everything memoized during the current request (after writes)"""
+    cache = _request_cache.get()
+    if cache is not None:
+        cache.clear()
+
+
+def cached(
+    ttl: float,
+    maxsize: int = 1024,
+    miss_ttl: Optional[float] = None,
+    lock: bool = False,
+) -> Callable:
+    """
+    Memoize an async function in-process, keyed by its arguments.
+
+    Results are kept for `ttl` seconds and None results for `miss_ttl` seconds
+    (defaults to `ttl`); a lifetime of 0 disables caching for that kind of
+    result. At most `maxsize` entries are kept, least recently used evicted
+    first. With `lock`, concurrent misses are serialised so only one caller
+    queries while the rest wait for its result.
+
+    The wrapper exposes invalidate(*args), prime(value, *args), clear() and
+    hits/misses counters. A miss still in flight when any of the first three
+    runs returns its result without caching it, so a write is never
+    overwritten by a read that started before it.
+    """
+    def decorator(func: Callable) -> Callable:
+        entries: OrderedDict[Hashable, tuple[float, Any]] = OrderedDict()
+        miss_lock = asyncio.Lock() if lock else None
+        generation = 0
+
+        def make_key(args: tuple, kwargs: dict) -> Hashable:
+            return args + tuple(sorted(kwargs.items())) if kwargs else args
+
+        def lookup(key: Hashable) -> Any:
+            entry = entries.get(key)
+            if entry is None:
+                return MISSING
+            if entry[0] <= time.monotonic():
+                del entries[key]
+                return MISSING
+            entries.move_to_end(key)
+            return entry[1]
+
+        def store(key: Hashable, value: Any) -> None:
+            lifetime = ttl if value is not None or miss_ttl is None else miss_ttl
+            if lifetime <= 0:
+                entries.pop(key, None)
+                return
+            entries[key] = (time.monotonic() + lifetime, value)
+            entries.move_to_end(key)
+            if len(entries) > maxsize:
+                entries.popitem(last=False)
+
+        @functools.wraps(func)
+        async def wrapper(*args, **kwargs):
+            key = make_key(args, kwargs)
+            value = lookup(key)
+            if value is not MISSING:
+                wrapper.hits += 1
+                return value
+
+            if miss_lock is None:
+                wrapper.misses += 1
+                started = generation
+                value = await func(*args, **kwargs)
+            else:
+                async with miss_lock:
+                    # Another caller may have filled the entry while we waited
+                    value = lookup(key)
+                    if value is not MISSING:
+                        wrapper.hits += 1
+                        return value
+                    wrapper.misses += 1
+                    started = generation
+                    value = await func(*args, **kwargs)
+
+            # Skip the store if the cache was written or dropped meanwhile
+            if started == generation:
+                store(key, value)
+            return value
+
+        def invalidate(*args, **kwargs) -> None:
+            nonlocal generation
+            generation += 1
+            entries.pop(make_key(args, kwargs), None)
+
+        def prime(value: Any, *args, **kwargs) -> None:
+            nonlocal generation
+            generation += 1
+            store(make_key(args, kwargs), value)
+
+        def clear() -> None:
+            nonlocal generation
+            generation += 1
+            entries.clear()
+
+        wrapper.invalidate = invalidate
+        wrapper.prime = prime
+        wrapper.clear = clear
+        wrapper.hits = 0
+        wrapper.misses = 0
+        return wrapper
+
+    return decorator
@@ -1,3 +1,20 @@
+from lnbits.db import SQLITE
+
+
+def _create_index(db, name: str, table: str, columns: str, where: str = "") -> str:
+    """
+    Build a CREATE INDEX statement for a table in the extension schema.
+    SQLite qualifies the index name with the schema, Postgres the table name.
+    """
+    if db.type == SQLITE:
+        query = f"CREATE INDEX IF NOT EXISTS tnaflasher.{name} ON {table} ({columns})"
+    else:
+        query = f"CREATE INDEX IF NOT EXISTS {name} ON tnaflasher.{table} ({columns})"
+    if where:
+        query += f" WHERE {where}"
+    return query
+
+
 async def m001_create_flash_requests(db):
     """Create the flash_requests table to track all flash payment attempts"""
     await db.execute(
@@ -30,16 +47,11 @@ async def m002_create_settings(db):
         )
         """
     )
-    # Insert default price
-    await db.execute(
-        """
-        INSERT INTO tnaflasher.settings (key, value) VALUES ('price_sats', '5000')
-        """
-    )
-    # Insert default wallet (empty - must be configured)
+    # Insert default price and wallet (empty - must be configured)
     await db.execute(
         """
-        INSERT INTO tnaflasher.settings (key, value) VALUES ('wallet_id', '')
+        INSERT INTO tnaflasher.settings (key, value)
+        VALUES ('price_sats', '5000'), ('wallet_id', '')
         """
     )
 
@@ -138,10 +150,66 @@ async def m007_create_audit_log(db):
         ("feature_audit_logging", "true"),
     ]
 
-    for key, value in feature_flags:
-        await db.execute(
-            """
-            INSERT INTO tnaflasher.settings (key, value) VALUES (:key, :value)
-            """,
-            {"key": key, "value": value}
+    # Seed them all with one multi-row INSERT
+    values = ", ".join(f"(:key_{i}, :value_{i})" for i in range(len(feature_flags)))
+    params = {}
+    for i, (key, value) in enumerate(feature_flags):
+        params[f"key_{i}"] = key
+        params[f"value_{i}"] = value
+    await db.execute(
+        f"INSERT INTO tnaflasher.settings (key, value) VALUES {values}",
+        params
+    )
+
+
+async def m008_create_flash_request_indexes(db):
+    """Index flash_requests for the dashboard stats and the recent-requests listing"""
+    # payment_hash, settings.key, promo_codes.code, miners.name and
+    # firmware(miner_id, version) are already indexed via PRIMARY KEY/UNIQUE
+    await db.execute(
+        _create_index(db, "idx_flash_requests_status_flashed_at", "flash_requests", "status, flashed_at")
+    )
+    await db.execute(
+        _create_index(db, "idx_flash_requests_created_at", "flash_requests", "created_at DESC")
+    )
+
+
+async def m009_create_stats(db):
+    """Create the stats table holding running totals for the admin dashboard"""
+    await db.execute(
+        """
+        CREATE TABLE tnaflasher.stats (
+            id INTEGER PRIMARY KEY,
+            total_flashes INTEGER NOT NULL DEFAULT 0,
+            total_sats INTEGER NOT NULL DEFAULT 0
+        )
+        """
+    )
+    # Seed the single row from existing history
+    await db.execute(
+        """
+        INSERT INTO tnaflasher.stats (id, total_flashes, total_sats)
+        SELECT 1, COUNT(*), COALESCE(SUM(amount_sats), 0)
+        FROM tnaflasher.flash_requests
+        WHERE status = 'flashed'
+        """
+    )
+
+
+async def m010_create_pending_flash_request_index(db):
+    """Partial index over pending flash requests for the dashboard pending counter"""
+    await db.execute(
+        _create_index(
+            db, "idx_flash_requests_pending", "flash_requests", "created_at", where="status = 'pending'"
         )
+    )
+
+
+async def m011_create_listing_indexes(db):
+    """Index the remaining newest-first listings (audit log, bulletins)"""
+    await db.execute(
+        _create_index(db, "idx_audit_log_created_at", "audit_log", "created_at DESC")
+    )
+    await db.execute(
+        _create_index(db, "idx_bulletins_active_created_at", "bulletins", "active, created_at DESC")
+    )
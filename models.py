@@ -2,11 +2,10 @@ from pydantic import BaseModel
 from typing import Optional
 
 
-class FlashRequest(BaseModel):
-    """Represents a flash payment request"""
+class FlashRequestSummary(BaseModel):
+    """Flash request as shown in admin listings (without the long bolt11)"""
     id: str
     payment_hash: str
-    bolt11: str
     device: str
     version: str
     amount_sats: int
@@ -17,6 +16,11 @@ class FlashRequest(BaseModel):
     flashed_at: Optional[int] = None
 
 
+class FlashRequest(FlashRequestSummary):
+    """Represents a flash payment request"""
+    bolt11: str
+
+
 class CreateFlashRequest(BaseModel):
     """Data needed to create a flash request"""
     device: str
@@ -1,8 +1,13 @@
+import asyncio
+import base64
+import functools
 import hashlib
 import hmac
-import json
 import os
+import secrets
+import struct
 import time
+from collections import OrderedDict
 from pathlib import Path
 from typing import Optional
 
@@ -10,17 +15,19 @@ from lnbits.core.services import create_invoice
 from lnbits.settings import settings
 
 from .crud import (
+    CATALOG_CACHE_TTL,
     create_flash_request,
+    create_paid_flash_request,
     get_flash_request,
     validate_promo_code,
-    increment_promo_usage,
-    mark_flash_paid,
-    get_miners,
+    try_consume_promo,
+    release_promo,
+    get_miners_with_firmware,
     get_miner,
-    get_firmware_by_miner,
     get_firmware_by_miner_and_version,
     create_audit_log,
 )
+from .helpers import cached, current_epoch_seconds, version_sort_key
 
 
 # Token expiry time (5 minutes)
@@ -29,7 +36,36 @@ TOKEN_EXPIRY_SECONDS = 300
 # Secret for signing tokens (in production, use environment variable)
 TOKEN_SECRET = os.environ.get("TNAFLASHER_SECRET", "change-this-secret-in-production")
 
+# Token payload: payment hash (32 bytes), issued_at, expires_at, 8-byte nonce,
+# then device and version as 2-byte length-prefixed UTF-8 strings
+_TOKEN_HEADER = struct.Struct("!32sQQ8s")
+_TOKEN_FIELD_LEN = struct.Struct("!H")
+# Unpadded base64url of a 32-byte HMAC-SHA256 digest
+_TOKEN_SIGNATURE_LEN = 43
 
+# HMAC keyed once at import; each signature starts from a copy of it
+_TOKEN_SECRET_BYTES = TOKEN_SECRET.encode()
+_HMAC_PROTO = hmac.new(_TOKEN_SECRET_BYTES, b"", hashlib.sha256)
+
+
+def _sign(payload: bytes) -> bytes:
+    """Raw HMAC-SHA256 digest of a token payload"""
+    mac = _HMAC_PROTO.copy()
+    mac.update(payload)
+    return mac.digest()
+
+
+def _b64url_encode(data: bytes) -> str:
+    """Unpadded base64url, safe to pass in a query string"""
+    return base64.urlsafe_b64encode(data).rstrip(b"=").decode()
+
+
+def _b64url_decode(text: str) -> bytes:
+    """Decode unpadded base64url"""
+    return base64.urlsafe_b64decode(text + "=" * (-len(text) % 4))
+
+
+@functools.cache
 def get_firmware_dir() -> Path:
     """Get the firmware directory path (persistent data volume)"""
     firmware_dir = Path(settings.lnbits_data_folder) / "tnaflasher" / "firmware"
@@ -37,13 +73,57 @@ def get_firmware_dir() -> Path:
     return firmware_dir
 
 
+# Firmware files recently seen on disk: path -> verified until (monotonic).
+# Only hits are remembered, so a freshly uploaded file is found immediately.
+FIRMWARE_EXISTS_TTL = 60
+_firmware_exists_cache: dict[Path, float] = {}
+
+
+def resolve_firmware_path(stored: str) -> Path:
+    """Resolve a stored firmware path (legacy absolute, or relative to the firmware dir)"""
+    path = Path(stored)
+    return path if path.is_absolute() else get_firmware_dir() / stored
+
+
+async def firmware_file_exists(path: Path) -> bool:
+    """Check that a firmware file exists, trusting a recent positive check"""
+    verified_until = _firmware_exists_cache.get(path)
+    if verified_until is not None and verified_until > time.monotonic():
+        return True
+
+    # stat() can block on slow or networked volumes; keep it off the event loop
+    if await asyncio.to_thread(path.exists):
+        _firmware_exists_cache[path] = time.monotonic() + FIRMWARE_EXISTS_TTL
+        return True
+
+    _firmware_exists_cache.pop(path, None)
+    return False
+
+
+def forget_firmware_file(path: Path) -> None:
+    """Drop a firmware file from the existence cache (after deleting it)"""
+    _firmware_exists_cache.pop(path, None)
+
+
+# Device listings and firmware paths are read on every public request but only
+# change through the admin endpoints, which call invalidate_catalog(). They use
+# the same CATALOG_CACHE_TTL as the miner and firmware lookups in crud.
+
+
+def invalidate_catalog() -> None:
+    """Drop cached device listings and firmware paths after an admin change"""
+    get_available_devices.clear()
+    get_firmware_path.clear()
+
+
+@cached(ttl=CATALOG_CACHE_TTL)
 async def get_available_devices() -> list[dict]:
     """Get list of available devices with their firmware versions from database"""
     devices = []
-    miners = await get_miners()
 
-    for miner in miners:
-        firmware_list = await get_firmware_by_miner(miner.id)
+    for miner, firmware_list in await get_miners_with_firmware():
+        # Highest version first; numerically equal versions keep upload order
+        firmware_list.sort(key=lambda fw: version_sort_key(fw.version), reverse=True)
 
         # Build firmware info list with prices and notes
         firmware_info = []
@@ -67,6 +147,7 @@ async def get_available_devices() -> list[dict]:
     return devices
 
 
+@cached(ttl=CATALOG_CACHE_TTL, miss_ttl=0)
 async def get_firmware_path(miner_id: str, version: str) -> Optional[Path]:
     """Get the path to a firmware file"""
     firmware = await get_firmware_by_miner_and_version(miner_id, version)
@@ -75,10 +156,9 @@ async def get_firmware_path(miner_id: str, version: str) -> Optional[Path]:
         return None
 
     # Support both legacy absolute paths and new relative paths
-    stored = firmware.file_path
-    firmware_path = Path(stored) if Path(stored).is_absolute() else get_firmware_dir() / stored
+    firmware_path = resolve_firmware_path(firmware.file_path)
 
-    if firmware_path.exists():
+    if await firmware_file_exists(firmware_path):
         return firmware_path
 
     return None
@@ -102,9 +182,8 @@ async def create_flash_invoice(
         raise ValueError(f"Firmware not found: {device} {version}")
 
     # Check firmware file exists
-    stored = firmware.file_path
-    firmware_path = Path(stored) if Path(stored).is_absolute() else get_firmware_dir() / stored
-    if not firmware_path.exists():
+    firmware_path = resolve_firmware_path(firmware.file_path)
+    if not await firmware_file_exists(firmware_path):
         raise ValueError(f"Firmware file not found: {device} {version}")
 
     # Get price from firmware (per-firmware pricing)
@@ -118,9 +197,12 @@ async def create_flash_invoice(
         if not firmware.discount_enabled:
             raise ValueError("Discounts are not available for this firmware")
 
-        is_valid, discount_percent, message = await validate_promo_code(promo_code)
-        if not is_valid:
-            raise ValueError(message)
+        # Claim a use atomically so concurrent checkouts can't oversell a code
+        discount_percent = await try_consume_promo(promo_code)
+        if discount_percent is None:
+            # Cold path: look the code up again only to explain the rejection
+            is_valid, _, message = await validate_promo_code(promo_code)
+            raise ValueError(message if not is_valid else "Promo code has reached its usage limit")
         # Calculate discounted price
         discount_amount = int(base_price * discount_percent / 100)
         final_price = base_price - discount_amount
@@ -131,16 +213,19 @@ async def create_flash_invoice(
         free_hash = hashlib.sha256(f"{device}{version}{time.time()}{os.urandom(8).hex()}".encode()).hexdigest()
 
         # Store flash request as already paid
-        await create_flash_request(
-            payment_hash=free_hash,
-            bolt11="FREE",
-            device=device,
-            version=version,
-            amount_sats=0
-        )
-
-        # Mark as paid immediately
-        await mark_flash_paid(free_hash)
+        try:
+            await create_paid_flash_request(
+                payment_hash=free_hash,
+                bolt11="FREE",
+                device=device,
+                version=version,
+                amount_sats=0
+            )
+        except Exception:
+            # Don't burn a promo use on a request that was never stored
+            if promo_code:
+                await release_promo(promo_code)
+            raise
 
         # Log to audit log
         promo_info = f", Promo: {promo_code} ({discount_percent}% off)" if promo_code else " (price was 0)"
@@ -151,40 +236,42 @@ async def create_flash_invoice(
             device_mac=None
         )
 
-        # Increment promo code usage
-        if promo_code:
-            await increment_promo_usage(promo_code)
-
         # No expiry needed for free flashes
         return {
             "payment_hash": free_hash,
             "bolt11": "FREE",
             "amount": 0,
-            "expires_at": int(time.time()) + (60 * 60)  # 1 hour to complete flash
+            "expires_at": current_epoch_seconds() + (60 * 60)  # 1 hour to complete flash
         }
 
     # Create LNbits invoice for paid flashes
-    payment = await create_invoice(
-        wallet_id=wallet_id,
-        amount=final_price,
-        memo=f"TNA Flash: {miner.name} {version}" + (f" ({discount_percent}% off)" if discount_percent > 0 else ""),
-        extra={
-            "tag": "tnaflasher",
-            "device": device,
-            "version": version,
-            "promo_code": promo_code if promo_code else None,
-            "discount_percent": discount_percent
-        }
-    )
+    try:
+        payment = await create_invoice(
+            wallet_id=wallet_id,
+            amount=final_price,
+            memo=f"TNA Flash: {miner.name} {version}" + (f" ({discount_percent}% off)" if discount_percent > 0 else ""),
+            extra={
+                "tag": "tnaflasher",
+                "device": device,
+                "version": version,
+                "promo_code": promo_code if promo_code else None,
+                "discount_percent": discount_percent
+            }
+        )
 
-    # Store flash request in database
-    await create_flash_request(
-        payment_hash=payment.payment_hash,
-        bolt11=payment.bolt11,
-        device=device,
-        version=version,
-        amount_sats=final_price
-    )
+        # Store flash request in database
+        await create_flash_request(
+            payment_hash=payment.payment_hash,
+            bolt11=payment.bolt11,
+            device=device,
+            version=version,
+            amount_sats=final_price
+        )
+    except Exception:
+        # Don't burn a promo use on a checkout that never got stored
+        if promo_code:
+            await release_promo(promo_code)
+        raise
 
     # Log to audit log
     promo_info = f", Promo: {promo_code} ({discount_percent}% off, base: {base_price} sats)" if promo_code else ""
@@ -195,12 +282,8 @@ async def create_flash_invoice(
         device_mac=None
     )
 
-    # Increment promo code usage (it will be counted when invoice is created)
-    if promo_code:
-        await increment_promo_usage(promo_code)
-
     # Calculate expiry time (15 minutes from now)
-    expires_at = int(time.time()) + (15 * 60)
+    expires_at = current_epoch_seconds() + (15 * 60)
 
     return {
         "payment_hash": payment.payment_hash,
@@ -212,70 +295,149 @@ async def create_flash_invoice(
 
 def generate_flash_token(payment_hash: str, device: str, version: str) -> str:
     """Generate a signed token for firmware download"""
-    now = int(time.time())
-    expires_at = now + TOKEN_EXPIRY_SECONDS
+    # struct pads a short hash with zeros, so check the length up front
+    hash_bytes = bytes.fromhex(payment_hash)
+    if len(hash_bytes) != 32:
+        raise ValueError(f"Invalid payment hash: {payment_hash}")
 
-    # Create token payload
-    payload = {
-        "payment_hash": payment_hash,
-        "device": device,
-        "version": version,
-        "issued_at": now,
-        "expires_at": expires_at,
-        "nonce": hashlib.sha256(os.urandom(32)).hexdigest()[:16]
-    }
+    now = current_epoch_seconds()
+    expires_at = now + TOKEN_EXPIRY_SECONDS
 
-    # Encode payload
-    payload_json = json.dumps(payload, separators=(',', ':'))
-    payload_b64 = payload_json.encode().hex()
+    # Pack the fixed fields, then the length-prefixed device and version
+    device_bytes = device.encode()
+    version_bytes = version.encode()
+    payload_bytes = b"".join((
+        _TOKEN_HEADER.pack(hash_bytes, now, expires_at, secrets.token_bytes(8)),
+        _TOKEN_FIELD_LEN.pack(len(device_bytes)),
+        device_bytes,
+        _TOKEN_FIELD_LEN.pack(len(version_bytes)),
+        version_bytes,
+    ))
+    payload_b64 = _b64url_encode(payload_bytes)
 
     # Create signature
-    signature = hmac.new(
-        TOKEN_SECRET.encode(),
-        payload_json.encode(),
-        hashlib.sha256
-    ).hexdigest()
+    signature = _b64url_encode(_sign(payload_bytes))
 
     # Return token as payload.signature
     return f"{payload_b64}.{signature}"
 
 
-def verify_flash_token(token: str) -> Optional[dict]:
-    """Verify and decode a flash token"""
+# Tokens whose signature has been checked: blake2b(token) -> decoded fields.
+# Only valid tokens are kept, so junk submissions can't push them out. Keyed
+# by digest so raw bearer tokens are not kept in memory.
+TOKEN_CACHE_SIZE = 1024
+_checked_tokens: OrderedDict[bytes, tuple] = OrderedDict()
+
+
+def _token_cache_key(token: str) -> bytes:
+    """Cache key for a token"""
+    return hashlib.blake2b(token.encode(), digest_size=16).digest()
+
+
+def forget_flash_token(token: str) -> None:
+    """Drop a token from the verification cache (after it has been redeemed)"""
+    _checked_tokens.pop(_token_cache_key(token), None)
+
+
+def _decode_flash_token(token: str) -> Optional[tuple]:
+    """Check a token's signature and return its decoded fields (or None)"""
     try:
-        # Split token
-        parts = token.split(".")
-        if len(parts) != 2:
+        # Split token at the last dot; the signature has a fixed length
+        dot = token.rfind(".")
+        if dot < 0 or len(token) - dot - 1 != _TOKEN_SIGNATURE_LEN:
             return None
 
-        payload_b64, signature = parts
+        payload_b64, signature = token[:dot], token[dot + 1:]
 
         # Decode payload
-        payload_json = bytes.fromhex(payload_b64).decode()
-        payload = json.loads(payload_json)
+        payload_bytes = _b64url_decode(payload_b64)
+        hash_bytes, issued_at, expires_at, nonce = _TOKEN_HEADER.unpack_from(payload_bytes)
+
+        # Check expiry first: stale tokens are rejected without hashing.
+        # The payload is untrusted until the signature check below passes.
+        if expires_at < current_epoch_seconds():
+            return None
 
         # Verify signature
-        expected_sig = hmac.new(
-            TOKEN_SECRET.encode(),
-            payload_json.encode(),
-            hashlib.sha256
-        ).hexdigest()
+        expected_sig = _sign(payload_bytes)
 
-        if not hmac.compare_digest(signature, expected_sig):
+        if not hmac.compare_digest(_b64url_decode(signature), expected_sig):
             return None
 
-        # Check expiry
-        if payload.get("expires_at", 0) < int(time.time()):
-            return None
+        offset = _TOKEN_HEADER.size
+        (device_len,) = _TOKEN_FIELD_LEN.unpack_from(payload_bytes, offset)
+        offset += _TOKEN_FIELD_LEN.size
+        device = payload_bytes[offset:offset + device_len].decode()
+        offset += device_len
+        (version_len,) = _TOKEN_FIELD_LEN.unpack_from(payload_bytes, offset)
+        offset += _TOKEN_FIELD_LEN.size
+        version = payload_bytes[offset:offset + version_len].decode()
 
-        return payload
+        return hash_bytes.hex(), device, version, issued_at, expires_at, nonce.hex()
 
     except Exception:
         return None
 
 
+def verify_flash_token(token: str) -> Optional[dict]:
+    """Verify and decode a flash token"""
+    # Downloads retry with the same token, so the signature check is cached;
+    # expiry has to be re-checked on every call
+    key = _token_cache_key(token)
+    fields = _checked_tokens.get(key)
+    if fields is not None:
+        _checked_tokens.move_to_end(key)
+    else:
+        fields = _decode_flash_token(token)
+        if fields is None:
+            return None
+        _checked_tokens[key] = fields
+        if len(_checked_tokens) > TOKEN_CACHE_SIZE:
+            _checked_tokens.popitem(last=False)
+
+    payment_hash, device, version, issued_at, expires_at, nonce = fields
+    if expires_at < current_epoch_seconds():
+        # Expired for good; evict it now rather than waiting for LRU order
+        _checked_tokens.pop(key, None)
+        return None
+
+    return {
+        "payment_hash": payment_hash,
+        "device": device,
+        "version": version,
+        "issued_at": issued_at,
+        "expires_at": expires_at,
+        "nonce": nonce
+    }
+
+
+# Status replies that won't change on later polls: token already used, or a
+# status other than pending/paid. A cached "paid" reply is dropped through
+# forget_flash_status when the flash is marked complete.
+FLASH_STATUS_CACHE_SIZE = 4096
+_final_flash_status: OrderedDict[str, dict] = OrderedDict()
+
+
+def forget_flash_status(payment_hash: str) -> None:
+    """Drop a cached status reply after the request's status changes"""
+    _final_flash_status.pop(payment_hash, None)
+
+
+def _remember_flash_status(payment_hash: str, status: dict) -> dict:
+    """Cache a final status reply, evicting the oldest beyond the cap"""
+    _final_flash_status[payment_hash] = status
+    if len(_final_flash_status) > FLASH_STATUS_CACHE_SIZE:
+        _final_flash_status.popitem(last=False)
+    return dict(status)
+
+
 async def get_flash_status(payment_hash: str) -> dict:
     """Get the status of a flash request"""
+    reply = _final_flash_status.get(payment_hash)
+    if reply is not None:
+        _final_flash_status.move_to_end(payment_hash)
+        return dict(reply)
+
     request = await get_flash_request(payment_hash)
 
     if not request:
@@ -294,6 +456,8 @@ async def get_flash_status(payment_hash: str) -> dict:
             )
             return {"status": request.status, "token": token}
         else:
-            return {"status": request.status, "token_used": True}
+            return _remember_flash_status(
+                payment_hash, {"status": request.status, "token_used": True}
+            )
 
-    return {"status": request.status}
+    return _remember_flash_status(payment_hash, {"status": request.status})
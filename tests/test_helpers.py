@@ -0,0 +1,163 @@
+import asyncio
+from types import SimpleNamespace
+
+import pytest
+
+from tnaflasher import helpers
+from tnaflasher.helpers import cached
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    """Replace the monotonic clock used by the cache with a settable one"""
+    now = SimpleNamespace(value=1000.0)
+    monkeypatch.setattr(helpers, "time", SimpleNamespace(monotonic=lambda: now.value))
+    return now
+
+
+def make_counted(results: dict, **options):
+    """Build a cached lookup that records how often it really ran"""
+    calls = []
+
+    @cached(**options)
+    async def lookup(key):
+        calls.append(key)
+        return results.get(key)
+
+    return lookup, calls
+
+
+def test_cached_expires_after_ttl(clock):
+    """Test that values are served from cache until the ttl runs out"""
+    lookup, calls = make_counted({"a": 1}, ttl=30)
+
+    assert asyncio.run(lookup("a")) == 1
+    clock.value += 29
+    assert asyncio.run(lookup("a")) == 1
+    assert calls == ["a"]
+
+    clock.value += 1
+    assert asyncio.run(lookup("a")) == 1
+    assert calls == ["a", "a"]
+    assert lookup.hits == 1 and lookup.misses == 2
+
+
+def test_cached_uses_miss_ttl_for_none(clock):
+    """Test that None results get their own lifetime"""
+    lookup, calls = make_counted({"a": 1}, ttl=30, miss_ttl=5)
+
+    assert asyncio.run(lookup("missing")) is None
+    clock.value += 4
+    assert asyncio.run(lookup("missing")) is None
+    assert calls == ["missing"]
+
+    clock.value += 1
+    assert asyncio.run(lookup("missing")) is None
+    assert calls == ["missing", "missing"]
+
+
+def test_cached_zero_ttl_only_caches_misses(clock):
+    """Test that ttl=0 skips caching found values but not None"""
+    lookup, calls = make_counted({"a": 1}, ttl=0, miss_ttl=5)
+
+    asyncio.run(lookup("a"))
+    asyncio.run(lookup("a"))
+    asyncio.run(lookup("missing"))
+    asyncio.run(lookup("missing"))
+    assert calls == ["a", "a", "missing"]
+
+
+def test_cached_evicts_least_recently_used(clock):
+    """Test that the oldest untouched entry goes first once full"""
+    lookup, calls = make_counted({"a": 1, "b": 2, "c": 3}, ttl=30, maxsize=2)
+
+    async def run():
+        await lookup("a")
+        await lookup("b")
+        await lookup("a")  # a is now the most recently used
+        await lookup("c")  # evicts b
+        await lookup("a")
+        await lookup("b")
+
+    asyncio.run(run())
+    assert calls == ["a", "b", "c", "b"]
+
+
+def test_cached_invalidate_and_prime(clock):
+    """Test that invalidate forces a reload and prime skips one"""
+    results = {"a": 1}
+    lookup, calls = make_counted(results, ttl=30)
+
+    async def run():
+        assert await lookup("a") == 1
+        results["a"] = 2
+        lookup.invalidate("a")
+        assert await lookup("a") == 2
+        lookup.prime(3, "a")
+        assert await lookup("a") == 3
+        lookup.clear()
+        assert await lookup("a") == 2
+
+    asyncio.run(run())
+    assert calls == ["a", "a", "a"]
+
+
+@pytest.mark.parametrize("lock", [False, True])
+@pytest.mark.parametrize("reset", ["invalidate", "prime", "clear"])
+def test_cached_drops_result_of_miss_overtaken_by_write(clock, lock, reset):
+    """Test that a read started before a write doesn't cache its stale value"""
+    results = {"a": "old"}
+    release = asyncio.Event()
+    calls = []
+
+    @cached(ttl=30, lock=lock)
+    async def lookup(key):
+        calls.append(key)
+        value = results[key]
+        await release.wait()
+        return value
+
+    async def run():
+        pending = asyncio.create_task(lookup("a"))
+        await asyncio.sleep(0)
+
+        # The write lands while the read above is still waiting on the DB
+        results["a"] = "new"
+        if reset == "invalidate":
+            lookup.invalidate("a")
+        elif reset == "prime":
+            lookup.prime("new", "a")
+        else:
+            lookup.clear()
+
+        release.set()
+        assert await pending == "old"
+        assert await lookup("a") == "new"
+
+    asyncio.run(run())
+    assert len(calls) == (1 if reset == "prime" else 2)
+
+
+def test_cached_negative_entry_not_stored_after_insert(clock):
+    """Test that a poll racing an insert doesn't cache the row as missing"""
+    rows = {}
+    release = asyncio.Event()
+
+    @cached(ttl=0, miss_ttl=5)
+    async def get_request(payment_hash):
+        row = rows.get(payment_hash)
+        await release.wait()
+        return row
+
+    async def run():
+        poll = asyncio.create_task(get_request("abc"))
+        await asyncio.sleep(0)
+
+        rows["abc"] = {"status": "pending"}
+        get_request.invalidate("abc")
+
+        release.set()
+        assert await poll is None
+        assert await get_request("abc") == {"status": "pending"}
+
+    asyncio.run(run())
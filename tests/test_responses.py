@@ -0,0 +1,62 @@
+import gzip
+from types import SimpleNamespace
+
+import pytest
+
+from tnaflasher.views_api import _accepts_gzip, _json_response
+
+# Big enough that the gzipped body is smaller and gets used
+ITEMS = [{"device": "bitaxe", "versions": ["v1", "v2"]}] * 50
+
+
+def _get(accept_encoding: str = "", if_none_match: str = ""):
+    headers = {"accept-encoding": accept_encoding}
+    if if_none_match:
+        headers["if-none-match"] = if_none_match
+    request = SimpleNamespace(headers=headers)
+    return _json_response(request, "test-items", ITEMS, lambda items: {"items": items})
+
+
+@pytest.mark.parametrize(
+    "header",
+    ["gzip", "gzip, deflate, br", "br;q=1.0, gzip;q=0.8", "GZIP", "x-gzip", "*", "identity, *;q=0.5"],
+)
+def test_accepts_gzip(header):
+    """Test headers that allow a gzip body"""
+    assert _accepts_gzip(header)
+
+
+@pytest.mark.parametrize(
+    "header",
+    ["", "identity", "br, deflate", "gzip;q=0", "gzip;q=0.000, br", "*;q=0", "gzip;q=0, *", "gzip;q=bogus"],
+)
+def test_rejects_gzip(header):
+    """Test headers that don't allow a gzip body"""
+    assert not _accepts_gzip(header)
+
+
+def test_gzip_variant_has_its_own_etag():
+    """Test that the two encodings of a body don't share an ETag"""
+    plain = _get()
+    zipped = _get("gzip")
+
+    assert zipped.headers["content-encoding"] == "gzip"
+    assert gzip.decompress(zipped.body) == plain.body
+    assert zipped.headers["etag"] == plain.headers["etag"][:-1] + '-gz"'
+
+
+@pytest.mark.parametrize("accept_encoding", ["", "gzip"])
+@pytest.mark.parametrize("variant", ["", "gzip"])
+def test_if_none_match_accepts_either_etag(accept_encoding, variant):
+    """Test that a cached copy in either encoding gets a 304"""
+    etag = _get(variant).headers["etag"]
+
+    for if_none_match in (etag, f"W/{etag}", f'"other", {etag}'):
+        response = _get(accept_encoding, if_none_match)
+        assert response.status_code == 304
+        assert response.headers["etag"] == _get(accept_encoding).headers["etag"]
+
+
+def test_if_none_match_stale_etag():
+    """Test that an outdated ETag gets the full body"""
+    assert _get("gzip", '"0000000000000000-gz"').status_code == 200
@@ -0,0 +1,122 @@
+import base64
+
+import pytest
+
+from tnaflasher import services
+from tnaflasher.services import (
+    TOKEN_EXPIRY_SECONDS,
+    generate_flash_token,
+    verify_flash_token,
+)
+
+PAYMENT_HASH = "ab" * 32
+
+
+@pytest.fixture(autouse=True)
+def empty_token_cache():
+    """Start every test with nothing in the verification cache"""
+    services._checked_tokens.clear()
+    yield
+    services._checked_tokens.clear()
+
+
+def _b64decode(text: str) -> bytes:
+    return base64.urlsafe_b64decode(text + "=" * (-len(text) % 4))
+
+
+def _b64encode(data: bytes) -> str:
+    return base64.urlsafe_b64encode(data).rstrip(b"=").decode()
+
+
+def test_token_round_trip():
+    """Test that a fresh token decodes to the fields it was made from"""
+    token = generate_flash_token(PAYMENT_HASH, "bitaxe-gamma", "v2.4.1")
+    data = verify_flash_token(token)
+
+    assert data["payment_hash"] == PAYMENT_HASH
+    assert data["device"] == "bitaxe-gamma"
+    assert data["version"] == "v2.4.1"
+    assert data["expires_at"] - data["issued_at"] == TOKEN_EXPIRY_SECONDS
+    assert len(data["nonce"]) == 16
+
+
+def test_token_round_trip_non_ascii():
+    """Test that non-ASCII device and version names survive encoding"""
+    token = generate_flash_token(PAYMENT_HASH, "Nerd⚡Miner", "v1.0-β")
+    data = verify_flash_token(token)
+
+    assert data["device"] == "Nerd⚡Miner"
+    assert data["version"] == "v1.0-β"
+
+
+def test_tokens_are_unique():
+    """Test that two tokens for the same request differ"""
+    first = generate_flash_token(PAYMENT_HASH, "bitaxe", "v1")
+    second = generate_flash_token(PAYMENT_HASH, "bitaxe", "v1")
+    assert first != second
+
+
+def test_tampered_payload_rejected():
+    """Test that changing the payload invalidates the signature"""
+    token = generate_flash_token(PAYMENT_HASH, "bitaxe", "v1")
+    payload_b64, signature = token.rsplit(".", 1)
+
+    payload = bytearray(_b64decode(payload_b64))
+    payload[-1] ^= 0x01  # last byte of the version string
+    tampered = f"{_b64encode(bytes(payload))}.{signature}"
+
+    assert verify_flash_token(tampered) is None
+
+
+def test_tampered_signature_rejected():
+    """Test that a signature of the right length but wrong value fails"""
+    token = generate_flash_token(PAYMENT_HASH, "bitaxe", "v1")
+    payload_b64, signature = token.rsplit(".", 1)
+
+    flipped = "B" if signature[0] == "A" else "A"
+    assert verify_flash_token(f"{payload_b64}.{flipped}{signature[1:]}") is None
+
+
+@pytest.mark.parametrize("change", [lambda s: s[:-1], lambda s: s + "A", lambda s: ""])
+def test_wrong_signature_length_rejected(change):
+    """Test that truncated, padded or missing signatures fail"""
+    token = generate_flash_token(PAYMENT_HASH, "bitaxe", "v1")
+    payload_b64, signature = token.rsplit(".", 1)
+
+    assert verify_flash_token(f"{payload_b64}.{change(signature)}") is None
+
+
+@pytest.mark.parametrize("token", ["", "no-dot-here", ".", "!!!." + "A" * 43])
+def test_garbage_rejected(token):
+    """Test that strings that aren't tokens at all are rejected"""
+    assert verify_flash_token(token) is None
+
+
+def test_expired_token_rejected(monkeypatch):
+    """Test that a token stops verifying once it expires"""
+    token = generate_flash_token(PAYMENT_HASH, "bitaxe", "v1")
+    assert verify_flash_token(token) is not None
+
+    issued = services.current_epoch_seconds()
+    monkeypatch.setattr(
+        services, "current_epoch_seconds", lambda: issued + TOKEN_EXPIRY_SECONDS + 1
+    )
+    assert verify_flash_token(token) is None
+
+
+@pytest.mark.parametrize("payment_hash", ["", "abcd", "zz" * 32, "ab" * 33])
+def test_malformed_payment_hash_rejected(payment_hash):
+    """Test that only 32-byte hex payment hashes can be signed"""
+    with pytest.raises(ValueError):
+        generate_flash_token(payment_hash, "bitaxe", "v1")
+
+
+def test_invalid_tokens_not_cached():
+    """Test that rejected tokens can't evict valid ones from the cache"""
+    token = generate_flash_token(PAYMENT_HASH, "bitaxe", "v1")
+    assert verify_flash_token(token) is not None
+
+    for i in range(services.TOKEN_CACHE_SIZE + 10):
+        assert verify_flash_token(f"junk{i}.{'A' * 43}") is None
+
+    assert list(services._checked_tokens) == [services._token_cache_key(token)]
@@ -1,3 +1,5 @@
+import asyncio
+
 from fastapi import APIRouter, Request, Depends
 from fastapi.responses import HTMLResponse
 from lnbits.core.models import User
@@ -8,6 +10,25 @@ from . import tnaflasher_renderer
 
 tnaflasher_generic_router = APIRouter()
 
+TEMPLATE_DIR = Path(__file__).parent / "templates" / "tnaflasher"
+
+# Standalone page templates split around the wallet_id placeholder:
+# file name -> (mtime_ns, parts). Re-read only when the file changes.
+_page_templates: dict[str, tuple[int, list[str]]] = {}
+
+
+async def _render_page(name: str, wallet_id: str) -> str:
+    """Fill the wallet_id into a standalone page template"""
+    template_path = TEMPLATE_DIR / name
+    mtime_ns = template_path.stat().st_mtime_ns
+    cached = _page_templates.get(name)
+    if cached is None or cached[0] != mtime_ns:
+        # The templates are large; read them off the event loop
+        content = await asyncio.to_thread(template_path.read_text)
+        cached = (mtime_ns, content.split("{{ wallet_id }}"))
+        _page_templates[name] = cached
+    return wallet_id.join(cached[1])
+
 
 @tnaflasher_generic_router.get("/", response_class=HTMLResponse)
 async def index(req: Request, user: User = Depends(check_user_exists)):
@@ -52,20 +73,12 @@ async def public_page(req: Request, wallet_id: str):
             )
         wallet_id = configured_wallet
 
-    # Read the standalone HTML template and replace wallet_id
-    template_path = Path(__file__).parent / "templates" / "tnaflasher" / "public_page.html"
-    html_content = template_path.read_text()
-    # Replace Jinja2 variable with actual wallet_id
-    html_content = html_content.replace("{{ wallet_id }}", wallet_id)
-    return HTMLResponse(content=html_content)
+    # Standalone HTML template with the wallet_id filled in
+    return HTMLResponse(content=await _render_page("public_page.html", wallet_id))
 
 
 @tnaflasher_generic_router.get("/{wallet_id}/advanced", response_class=HTMLResponse)
 async def advanced_page(req: Request, wallet_id: str):
     """Advanced control center page - client-side device interaction"""
-    # Read the standalone HTML template and replace wallet_id
-    template_path = Path(__file__).parent / "templates" / "tnaflasher" / "advanced_page.html"
-    html_content = template_path.read_text()
-    # Replace Jinja2 variables with actual wallet_id
-    html_content = html_content.replace("{{ wallet_id }}", wallet_id)
-    return HTMLResponse(content=html_content)
+    # Standalone HTML template with the wallet_id filled in
+    return HTMLResponse(content=await _render_page("advanced_page.html", wallet_id))
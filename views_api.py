@@ -1,9 +1,15 @@
-from fastapi import APIRouter, Query, Depends, HTTPException, UploadFile, File
-from fastapi.responses import FileResponse
+from fastapi import APIRouter, Query, Depends, HTTPException, Request, Response, UploadFile, File
+from fastapi.responses import FileResponse, JSONResponse
 from lnbits.core.models import User
 from lnbits.decorators import check_admin
+import anyio
+import asyncio
+import gzip
+import hashlib
+import hmac
+import json
 from pathlib import Path
-from typing import Optional
+from typing import Any, Callable, Optional
 
 from .models import (
     CreateFlashRequest,
@@ -24,7 +30,7 @@ from .models import (
     AuditLogsResponse,
 )
 from .crud import (
-    get_all_flash_requests,
+    get_all_flash_requests_brief,
     get_flash_request,
     get_stats,
     get_price,
@@ -47,6 +53,7 @@ from .crud import (
     get_miner,
     delete_miner,
     create_firmware,
+    create_firmware_many,
     get_firmware_by_miner,
     get_firmware,
     create_audit_log,
@@ -62,14 +69,119 @@ from .services import (
     get_available_devices,
     create_flash_invoice,
     get_flash_status,
+    forget_flash_status,
     get_firmware_path,
+    invalidate_catalog,
     get_firmware_dir,
+    resolve_firmware_path,
+    forget_firmware_file,
     verify_flash_token,
+    forget_flash_token,
 )
 
 tnaflasher_api_router = APIRouter(prefix="/api/v1")
 
 
+class FirmwareFileResponse(FileResponse):
+    """FileResponse that streams firmware images in 1 MiB chunks (Starlette reads 64 KiB)"""
+    chunk_size = 1024 * 1024
+
+
+# Uploads are copied to disk in pieces so memory use doesn't grow with image size
+UPLOAD_CHUNK_SIZE = 1024 * 1024
+# Files written at once by the bulk upload endpoint
+BULK_UPLOAD_CONCURRENCY = 4
+
+
+async def _save_upload(file: UploadFile, path: Path) -> int:
+    """Stream an uploaded file to disk and return its size in bytes"""
+    size = 0
+    async with await anyio.open_file(path, "wb") as out:
+        while chunk := await file.read(UPLOAD_CHUNK_SIZE):
+            await out.write(chunk)
+            size += len(chunk)
+    return size
+
+
+async def _discard_uploads(paths: list[Path]) -> None:
+    """Remove files written by a failed upload"""
+    for path in paths:
+        await anyio.Path(path).unlink(missing_ok=True)
+
+
+# Serialized bodies for hot public GETs:
+# name -> (source, body, gzipped body, etag, gzip etag).
+# get_bulletins etc. hand back the same object while their own cache holds,
+# so a body is rebuilt only when the underlying data is. The two encodings
+# are different byte streams, so each gets its own strong ETag.
+_response_bodies: dict[str, tuple[Any, bytes, Optional[bytes], str, str]] = {}
+
+
+def _accepts_gzip(accept_encoding: str) -> bool:
+    """Whether an Accept-Encoding header allows a gzip body (honouring q=0)"""
+    wildcard = False
+    for coding in accept_encoding.split(","):
+        name, _, params = coding.partition(";")
+        name = name.strip().lower()
+        quality = 1.0
+        for param in params.split(";"):
+            key, _, value = param.partition("=")
+            if key.strip().lower() == "q":
+                try:
+                    quality = float(value)
+                except ValueError:
+                    quality = 0.0
+        if name in ("gzip", "x-gzip"):
+            return quality > 0
+        if name == "*":
+            wildcard = quality > 0
+    return wildcard
+
+
+def _json_response(request: Request, name: str, source: Any, build: Callable) -> Response:
+    """JSON response for `source`, serialized (and gzipped) once per source object"""
+    entry = _response_bodies.get(name)
+    if entry is None or (entry[0] is not source and entry[0] != source):
+        body = json.dumps(build(source), separators=(",", ":")).encode()
+        gzipped = gzip.compress(body)
+        digest = hashlib.blake2b(body, digest_size=8).hexdigest()
+        entry = (
+            source, body, gzipped if len(gzipped) < len(body) else None,
+            f'"{digest}"', f'"{digest}-gz"'
+        )
+        _response_bodies[name] = entry
+
+    _, body, gzipped, etag, gzip_etag = entry
+    use_gzip = gzipped is not None and _accepts_gzip(request.headers.get("accept-encoding", ""))
+    headers = {"Vary": "Accept-Encoding", "ETag": gzip_etag if use_gzip else etag}
+
+    # Conditional GET: the client already has this data in either encoding
+    if_none_match = request.headers.get("if-none-match")
+    if if_none_match and (
+        if_none_match.strip() == "*"
+        or any(
+            tag.strip().removeprefix("W/") in (etag, gzip_etag)
+            for tag in if_none_match.split(",")
+        )
+    ):
+        return Response(status_code=304, headers=headers)
+
+    if use_gzip:
+        headers["Content-Encoding"] = "gzip"
+        body = gzipped
+    return Response(content=body, media_type="application/json", headers=headers)
+
+
+# Body for endpoints that only report success. Responses carry per-request
+# state (headers, background tasks), so a fresh one wraps the shared bytes.
+_SUCCESS_BODY = b'{"success":true}'
+
+
+def _success() -> Response:
+    """{"success": true} without going through the JSON encoder"""
+    return Response(content=_SUCCESS_BODY, media_type="application/json")
+
+
 # ============== Public Endpoints ==============
 
 @tnaflasher_api_router.get("/health")
@@ -79,17 +191,17 @@ async def api_health():
 
 
 @tnaflasher_api_router.get("/devices")
-async def api_get_devices():
+async def api_get_devices(request: Request):
     """Get list of available devices and firmware versions"""
     devices = await get_available_devices()
-    return {"devices": devices}
+    return _json_response(request, "devices", devices, lambda items: {"devices": items})
 
 
-@tnaflasher_api_router.get("/price")
-async def api_get_price() -> PriceResponse:
+@tnaflasher_api_router.get("/price", response_model=PriceResponse)
+async def api_get_price(request: Request):
     """Get the current flash price (legacy - now prices are per-firmware)"""
     price = await get_price()
-    return PriceResponse(price_sats=price)
+    return _json_response(request, "price", price, lambda value: {"price_sats": value})
 
 
 @tnaflasher_api_router.post("/flash/invoice")
@@ -115,14 +227,16 @@ async def api_create_invoice(
         raise HTTPException(status_code=400, detail=str(e))
 
 
-@tnaflasher_api_router.get("/flash/status/{payment_hash}")
-async def api_get_status(payment_hash: str) -> FlashStatusResponse:
+@tnaflasher_api_router.get("/flash/status/{payment_hash}", response_model=FlashStatusResponse)
+async def api_get_status(payment_hash: str):
     """Check the status of a flash payment"""
+    # Polled every few seconds: build the FlashStatusResponse shape directly
+    # instead of constructing and re-validating a model per poll
     result = await get_flash_status(payment_hash)
-    return FlashStatusResponse(
-        status=result.get("status", "not_found"),
-        token=result.get("token")
-    )
+    return JSONResponse({
+        "status": result.get("status", "not_found"),
+        "token": result.get("token")
+    })
 
 
 @tnaflasher_api_router.get("/firmware/{device}/{version}")
@@ -138,7 +252,11 @@ async def api_download_firmware(
         raise HTTPException(status_code=401, detail="Invalid or expired token")
 
     # Check token matches request
-    if payload.get("device") != device or payload.get("version") != version:
+    # compare_digest only accepts ASCII str, so compare the UTF-8 bytes; "&"
+    # evaluates both checks so timing doesn't reveal which field differed
+    device_ok = hmac.compare_digest(payload["device"].encode(), device.encode())
+    version_ok = hmac.compare_digest(payload["version"].encode(), version.encode())
+    if not (device_ok & version_ok):
         raise HTTPException(status_code=401, detail="Token does not match request")
 
     # Get firmware path
@@ -146,9 +264,19 @@ async def api_download_firmware(
     if not firmware_path:
         raise HTTPException(status_code=404, detail="Firmware not found")
 
+    # Stat once, off the event loop, and hand the result to the response.
+    # The cached path may be stale if the file was removed behind our back.
+    try:
+        stat_result = await anyio.Path(firmware_path).stat()
+    except FileNotFoundError:
+        forget_firmware_file(firmware_path)
+        invalidate_catalog()
+        raise HTTPException(status_code=404, detail="Firmware not found")
+
     # Mark token as used
     payment_hash = payload.get("payment_hash", "")
     await mark_token_used(payment_hash)
+    forget_flash_token(token)
 
     # Resolve miner name from device ID
     miner_name = device  # fallback to UUID if lookup fails
@@ -165,8 +293,9 @@ async def api_download_firmware(
     )
 
     # Return firmware file
-    return FileResponse(
+    return FirmwareFileResponse(
         path=firmware_path,
+        stat_result=stat_result,
         filename=f"{device}_{version}.bin",
         media_type="application/octet-stream"
     )
@@ -180,6 +309,7 @@ async def api_mark_complete(
 ):
     """Mark a flash as complete (called after successful flash)"""
     result = await mark_flash_complete(payment_hash)
+    forget_flash_status(payment_hash)
     if not result:
         raise HTTPException(status_code=404, detail="Flash request not found")
 
@@ -198,7 +328,7 @@ async def api_mark_complete(
         device_mac=device_mac
     )
 
-    return {"success": True}
+    return _success()
 
 
 # ============== Admin Endpoints ==============
@@ -206,8 +336,9 @@ async def api_mark_complete(
 @tnaflasher_api_router.get("/admin/requests")
 async def api_admin_get_requests(user: User = Depends(check_admin)):
     """Get all flash requests (admin only)"""
-    requests = await get_all_flash_requests()
-    return [r.dict() for r in requests]
+    requests = await get_all_flash_requests_brief()
+    # Rows hold only str/int/bool/None, so skip FastAPI's recursive jsonable_encoder pass
+    return JSONResponse([r.dict() for r in requests])
 
 
 @tnaflasher_api_router.get("/admin/stats")
@@ -270,6 +401,7 @@ async def api_admin_create_miner(
         raise HTTPException(status_code=400, detail="Miner name is required")
 
     miner = await create_miner(data.name.strip())
+    invalidate_catalog()
     return miner.dict()
 
 
@@ -287,15 +419,15 @@ async def api_admin_delete_miner(
     firmware_list = await get_firmware_by_miner(miner_id)
     for fw in firmware_list:
         try:
-            stored = fw.file_path
-            file_path = Path(stored) if Path(stored).is_absolute() else get_firmware_dir() / stored
-            if file_path.exists():
-                file_path.unlink()
+            file_path = resolve_firmware_path(fw.file_path)
+            forget_firmware_file(file_path)
+            await anyio.Path(file_path).unlink(missing_ok=True)
         except Exception:
             pass  # Ignore file deletion errors
 
     await delete_miner(miner_id)
-    return {"success": True}
+    invalidate_catalog()
+    return _success()
 
 
 # ============== Firmware Management Endpoints ==============
@@ -311,7 +443,7 @@ async def api_admin_get_firmware(
         raise HTTPException(status_code=404, detail="Miner not found")
 
     firmware_list = await get_firmware_by_miner(miner_id)
-    return {"firmware": [fw.dict() for fw in firmware_list]}
+    return JSONResponse({"firmware": [fw.dict() for fw in firmware_list]})
 
 
 @tnaflasher_api_router.post("/admin/firmware/upload")
@@ -342,12 +474,11 @@ async def api_admin_upload_firmware(
     # Create miner directory if needed
     firmware_dir = get_firmware_dir()
     miner_dir = firmware_dir / miner_id
-    miner_dir.mkdir(parents=True, exist_ok=True)
+    await anyio.Path(miner_dir).mkdir(parents=True, exist_ok=True)
 
     # Save the file
     file_path = miner_dir / f"{version}.bin"
-    content = await file.read()
-    file_path.write_bytes(content)
+    size = await _save_upload(file, file_path)
 
     # Create firmware record in database (store relative path)
     firmware = await create_firmware(
@@ -358,11 +489,88 @@ async def api_admin_upload_firmware(
         notes=notes,
         discount_enabled=discount_enabled
     )
+    invalidate_catalog()
 
     return {
         "success": True,
         "firmware": firmware.dict(),
-        "size": len(content)
+        "size": size
+    }
+
+
+@tnaflasher_api_router.post("/admin/firmware/upload-bulk")
+async def api_admin_upload_firmware_bulk(
+    miner_id: str = Query(...),
+    price_sats: int = Query(..., ge=0),
+    notes: str = Query(None),
+    discount_enabled: bool = Query(True),
+    files: list[UploadFile] = File(...),
+    user: User = Depends(check_admin)
+):
+    """Upload several firmware files for one miner; versions come from the file names (admin only)"""
+    # Validate miner exists
+    miner = await get_miner(miner_id)
+    if not miner:
+        raise HTTPException(status_code=400, detail=f"Unknown miner: {miner_id}")
+
+    # Validate every file before writing any of them
+    existing_versions = {fw.version for fw in await get_firmware_by_miner(miner_id)}
+    versions = []
+    for file in files:
+        if not file.filename.endswith(".bin"):
+            raise HTTPException(status_code=400, detail=f"File must be a .bin file: {file.filename}")
+        version = Path(file.filename).stem
+        if not version or version.startswith("."):
+            raise HTTPException(status_code=400, detail=f"Invalid file name: {file.filename}")
+        if version in existing_versions or version in versions:
+            raise HTTPException(status_code=400, detail=f"Firmware version {version} already exists for this miner")
+        versions.append(version)
+
+    # Create miner directory if needed
+    miner_dir = get_firmware_dir() / miner_id
+    await anyio.Path(miner_dir).mkdir(parents=True, exist_ok=True)
+
+    # Save the files concurrently, a few at a time
+    disk_slots = asyncio.Semaphore(BULK_UPLOAD_CONCURRENCY)
+    paths = [miner_dir / f"{version}.bin" for version in versions]
+
+    async def save(file: UploadFile, path: Path) -> int:
+        async with disk_slots:
+            return await _save_upload(file, path)
+
+    # Let every write finish before cleaning up, so none is left running
+    results = await asyncio.gather(
+        *(save(file, path) for file, path in zip(files, paths)),
+        return_exceptions=True
+    )
+    errors = [result for result in results if isinstance(result, BaseException)]
+    if errors:
+        await _discard_uploads(paths)
+        raise errors[0]
+    sizes = results
+
+    # Create all firmware records in one statement (store relative paths)
+    try:
+        firmware_list = await create_firmware_many([
+            {
+                "miner_id": miner_id,
+                "version": version,
+                "price_sats": price_sats,
+                "file_path": f"{miner_id}/{version}.bin",
+                "notes": notes,
+                "discount_enabled": discount_enabled
+            }
+            for version in versions
+        ])
+    except Exception:
+        await _discard_uploads(paths)
+        raise
+    invalidate_catalog()
+
+    return {
+        "success": True,
+        "firmware": [fw.dict() for fw in firmware_list],
+        "sizes": sizes
     }
 
 
@@ -385,6 +593,7 @@ async def api_admin_update_firmware(
         notes=notes,
         discount_enabled=discount_enabled
     )
+    invalidate_catalog()
 
     return {"success": True, "firmware": updated.dict()}
 
@@ -401,26 +610,31 @@ async def api_admin_delete_firmware(
 
     # Delete the file
     try:
-        stored = firmware.file_path
-        file_path = Path(stored) if Path(stored).is_absolute() else get_firmware_dir() / stored
-        if file_path.exists():
-            file_path.unlink()
+        file_path = resolve_firmware_path(firmware.file_path)
+        forget_firmware_file(file_path)
+        await anyio.Path(file_path).unlink(missing_ok=True)
     except Exception:
         pass  # Ignore file deletion errors
 
     # Delete from database
     await delete_firmware(firmware_id)
+    invalidate_catalog()
 
-    return {"success": True}
+    return _success()
 
 
 # ============== Bulletin Endpoints ==============
 
-@tnaflasher_api_router.get("/bulletins")
-async def api_get_bulletins() -> BulletinsResponse:
+@tnaflasher_api_router.get("/bulletins", response_model=BulletinsResponse)
+async def api_get_bulletins(request: Request):
     """Get active bulletins for public display"""
     bulletins = await get_bulletins(active_only=True)
-    return BulletinsResponse(bulletins=bulletins)
+    return _json_response(
+        request,
+        "bulletins",
+        bulletins,
+        lambda items: {"bulletins": [b.dict() for b in items]}
+    )
 
 
 @tnaflasher_api_router.get("/admin/bulletins")
@@ -461,7 +675,7 @@ async def api_admin_delete_bulletin(
 ):
     """Delete a bulletin (admin only)"""
     await delete_bulletin(bulletin_id)
-    return {"success": True}
+    return _success()
 
 
 # ============== Promo Code Endpoints ==============
@@ -519,7 +733,7 @@ async def api_admin_delete_promo_code(
 ):
     """Delete a promo code (admin only)"""
     await delete_promo_code(promo_id)
-    return {"success": True}
+    return _success()
 
 
 # ============== Feature Flags Endpoints ==============
@@ -577,4 +791,4 @@ async def api_get_audit_log(
 async def api_clear_audit_log(user: User = Depends(check_admin)):
     """Clear all audit log entries (admin only)"""
     await clear_audit_log()
-    return {"success": True}
+    return _success()